@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Batched CoppeliaSim queries for the phase scripts.
+Runs small Lua snippets inside CoppeliaSim's sandbox script so that N per-object RPCs become one.
+"""
+
+import functools
+
+# Sandbox script of the current connection, resolved and probed once by _sandbox_for():
+# the sim proxy it belongs to, and the script to run snippets in (None if the server
+# rejected sandbox execution, so batched helpers go straight to their per-object fallback).
+_SANDBOX_SIM = None
+_SANDBOX_SCRIPT = None
+
+# Consecutive snippet failures per batched helper on the current connection. A helper
+# whose snippet fails _MAX_LUA_FAILURES times in a row goes straight to its per-object
+# fallback from then on (with one [WARN]), rather than paying a failed RPC on top of it
+# every call.
+_MAX_LUA_FAILURES = 3
+_LUA_FAILURES = {}
+
+
+def _probe_sandbox(sim):
+    """Return the first sandbox script that runs a trivial snippet, or None."""
+    # CoppeliaSim 4.6+ addresses scripts by handle; older releases take the script type.
+    candidates = []
+    try:
+        candidates.append(sim.getScript(sim.scripttype_sandbox))
+    except Exception:
+        pass
+    legacy = getattr(sim, "scripttype_sandboxscript", None)
+    if legacy is not None:
+        candidates.append(legacy)
+    if not candidates:
+        print("[WARN] No sandbox script available in CoppeliaSim; using one remote call per object.")
+        return None
+    for script in candidates:
+        try:
+            sim.executeScriptString("return 1@lua", script)
+            return script
+        except Exception as e:
+            error = e
+    print(f"[WARN] CoppeliaSim rejected sandbox script execution ({error}); using one remote call per object.")
+    return None
+
+
+def _sandbox_for(sim):
+    global _SANDBOX_SIM, _SANDBOX_SCRIPT
+    if sim is not _SANDBOX_SIM:
+        _SANDBOX_SIM = sim
+        _SANDBOX_SCRIPT = _probe_sandbox(sim)
+        _LUA_FAILURES.clear()
+    return _SANDBOX_SCRIPT
+
+
+def run_lua(sim, code: str, name: str):
+    """Execute a Lua snippet in the sandbox script and return its value (a single RPC).
+
+    Returns None if the snippet fails or the server does not support sandbox execution;
+    callers then fall back to issuing the equivalent sim.* calls one by one. Only a
+    failed probe of the sandbox itself disables batching for the connection; a failing
+    snippet (e.g. a stale handle) or a transient error only affects that one call,
+    unless the snippet of helper `name` keeps failing (see _MAX_LUA_FAILURES).
+    """
+    script = _sandbox_for(sim)
+    failures = _LUA_FAILURES.get(name, 0)
+    if script is None or failures >= _MAX_LUA_FAILURES:
+        return None
+    try:
+        _, value = sim.executeScriptString(code + "@lua", script)
+    except Exception as e:
+        _LUA_FAILURES[name] = failures + 1
+        if failures + 1 == _MAX_LUA_FAILURES:
+            print(f"[WARN] Batched {name} failed {_MAX_LUA_FAILURES} times in a row ({e}); "
+                  "using one remote call per object for it from now on.")
+        return None
+    _LUA_FAILURES[name] = 0
+    return value
+
+
+def _lua_list(values) -> str:
+    """Format a sequence of numbers as a Lua table literal."""
+    return "{" + ",".join(repr(v) for v in values) + "}"
+
+
+@functools.lru_cache(maxsize=64)
+def _lua_handles(handles: tuple) -> str:
+    """_lua_list() for a handle tuple, cached: control loops pass the same handles every tick."""
+    return _lua_list(handles)
+
+
+def _object_name_or_none(sim, handle):
+    try:
+        return sim.getObjectName(handle)
+    except Exception:
+        return None
+
+
+def get_object_names(sim, handles):
+    """Return the name of each handle, fetched in one round-trip when possible.
+
+    A handle whose name cannot be read (e.g. a stale handle) gets None in its slot,
+    so one bad object does not fail the whole lookup.
+    """
+    handles = list(handles)
+    if not handles:
+        return []
+    # pcall per handle: a failed lookup yields false instead of aborting the whole snippet
+    names = run_lua(
+        sim,
+        "local r = {} for i, h in ipairs(%s) do "
+        "local ok, name = pcall(sim.getObjectName, h) r[i] = ok and name or false end return r"
+        % _lua_list(handles),
+        "get_object_names",
+    )
+    if isinstance(names, (list, tuple)) and len(names) == len(handles):
+        return [name if isinstance(name, str) else None for name in names]
+    return [_object_name_or_none(sim, h) for h in handles]
+
+
+def get_object_matrices(sim, handles):
+    """Return [sim.getObjectMatrix(h, -1) for h in handles] (12 values each), in one round-trip when possible."""
+    handles = tuple(handles)
+    values = run_lua(
+        sim,
+        "local r = {} for _, h in ipairs(%s) do "
+        "for _, v in ipairs(sim.getObjectMatrix(h, -1)) do r[#r + 1] = v end end return r"
+        % _lua_handles(handles),
+        "get_object_matrices",
+    )
+    n = len(handles)
+    if isinstance(values, (list, tuple)) and len(values) == 12 * n:
+        return [values[12 * i:12 * i + 12] for i in range(n)]
+    return [sim.getObjectMatrix(h, -1) for h in handles]
+
+
+def get_joint_positions_and_tip(sim, joint_handles, tip_handle):
+    """Return (q, p): the joint positions and the tip's world position, in one round-trip when possible."""
+    joint_handles = tuple(joint_handles)
+    values = run_lua(
+        sim,
+        "local r = {} for i, h in ipairs(%s) do r[i] = sim.getJointPosition(h) end "
+        "for _, v in ipairs(sim.getObjectPosition(%d, -1)) do r[#r + 1] = v end return r"
+        % (_lua_handles(joint_handles), tip_handle),
+        "get_joint_positions_and_tip",
+    )
+    n = len(joint_handles)
+    if isinstance(values, (list, tuple)) and len(values) == n + 3:
+        return values[:n], values[n:]
+    q = [sim.getJointPosition(h) for h in joint_handles]
+    return q, sim.getObjectPosition(tip_handle, -1)
+
+
+def set_joint_positions(sim, joint_handles, positions) -> None:
+    """Equivalent of sim.setJointPosition(h, v) for each (h, v) pair, in one round-trip when possible."""
+    joint_handles = tuple(joint_handles)
+    # float() so NumPy scalars format as plain Lua numbers and encode cleanly in the fallback.
+    positions = [float(v) for v in positions]
+    done = run_lua(
+        sim,
+        "local h, v = %s, %s for i = 1, #h do sim.setJointPosition(h[i], v[i]) end return #h"
+        % (_lua_handles(joint_handles), _lua_list(positions)),
+        "set_joint_positions",
+    )
+    if done == len(joint_handles):
+        return
+    for h, v in zip(joint_handles, positions):
+        sim.setJointPosition(h, v)
+
+
+def get_perturbed_tip_positions(sim, joint_handles, tip_handle, positions, eps: float):
+    """Tip world position with each joint in turn moved to positions[i] + eps (then restored).
+
+    This is the finite-difference sweep of a numerical Jacobian: 3 RPCs per joint done
+    one by one, or a single round-trip when the loop can run inside CoppeliaSim.
+    """
+    joint_handles = tuple(joint_handles)
+    positions = [float(v) for v in positions]
+    values = run_lua(
+        sim,
+        "local h, q, r = %s, %s, {} for i = 1, #h do "
+        "sim.setJointPosition(h[i], q[i] + %r) "
+        "for _, v in ipairs(sim.getObjectPosition(%d, -1)) do r[#r + 1] = v end "
+        "sim.setJointPosition(h[i], q[i]) end return r"
+        % (_lua_handles(joint_handles), _lua_list(positions), float(eps), tip_handle),
+        "get_perturbed_tip_positions",
+    )
+    n = len(joint_handles)
+    if isinstance(values, (list, tuple)) and len(values) == 3 * n:
+        return [values[3 * i:3 * i + 3] for i in range(n)]
+    tip_positions = []
+    for h, v in zip(joint_handles, positions):
+        sim.setJointPosition(h, v + eps)
+        tip_positions.append(sim.getObjectPosition(tip_handle, -1))
+        sim.setJointPosition(h, v)
+    return tip_positions
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Shared CoppeliaSim bootstrap for the phase scripts.
+Locates the ZMQ Remote API python client bundled with CoppeliaSim and puts it on sys.path.
+"""
+
+import functools
+import json
+import os
+import stat
+import sys
+from pathlib import Path
+
+# Set COPPELIA_VERBOSE=1 to print the [INFO]/[DEBUG] path diagnostics (silent by default).
+VERBOSE = bool(os.environ.get("COPPELIA_VERBOSE"))
+
+# --- CoppeliaSim ZMQ Remote API (macOS) ------------------------------------
+# The ZMQ python client lives inside the CoppeliaSim app bundle.
+# We add that folder to PYTHONPATH so `import coppeliasim_zmqremoteapi_client` works.
+# (Note: `import zmqRemoteApi` is deprecated but still works)
+# NOTE (CoppeliaSim 4.1+ layout):
+# The ZMQ Remote API Python client is typically located at:
+#   <CoppeliaSim.app>/Contents/Resources/programming/zmqRemoteApi/clients/python
+# That folder should contain:
+#   - zmqRemoteApi/   (package)
+#   - src/            (package)
+# Some builds also ship a minimal `Contents/Resources/python` folder WITHOUT zmqRemoteApi.
+# So we search multiple candidate folders inside the .app.
+COPPELIA_APP_CANDIDATES = [
+    # Common macOS install locations / app names (most likely first):
+    "/Applications/CoppeliaSim.app",
+    "/Applications/CoppeliaSimEdu.app",
+    "/Applications/coppeliaSim.app",
+    "/Applications/CoppeliaSimEdu_V4_10_0_rev0.app",
+
+    # If you run the app directly from Downloads:
+    str(Path.home() / "Downloads" / "CoppeliaSim.app"),
+    str(Path.home() / "Downloads" / "CoppeliaSimEdu.app"),
+    str(Path.home() / "Downloads" / "coppeliaSim.app"),
+    str(Path.home() / "Downloads" / "CoppeliaSimEdu_V4_10_0_rev0.app"),
+]
+
+# Candidate *internal* folders within the .app that may contain the ZMQ Remote API python client
+COPPELIA_INTERNAL_PY_CANDIDATES = [
+    "Contents/Resources/programming/zmqRemoteApi/clients/python",  # common
+    "Contents/Resources/programming/zmqRemoteApi/clients/python/zmqRemoteApi",  # fallback (some zips)
+    "Contents/Resources/python",  # older/alternate
+]
+
+
+# Discovery result is cached across runs so repeat launches skip the filesystem walk.
+# The cache is invalidated when the folder's mtime changes (e.g. CoppeliaSim was updated).
+COPPELIA_PY_PATH_CACHE = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "coppelia_joint_control"
+    / "py_path.json"
+)
+
+
+def _is_dir(path) -> bool:
+    # One stat() per probe; a missing parent also lands here, so callers
+    # don't need a separate exists() check first.
+    try:
+        return stat.S_ISDIR(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def is_valid_zmq_client(py_path) -> bool:
+    # Accept either:
+    #   py_path/zmqRemoteApi + py_path/src
+    # or:
+    #   py_path/zmqRemoteApi/src  (src nested)
+    pkg = os.path.join(py_path, "zmqRemoteApi")
+    if not _is_dir(pkg):
+        return False
+    return _is_dir(os.path.join(py_path, "src")) or _is_dir(os.path.join(pkg, "src"))
+
+
+def _normalize_internal(internal: str) -> str:
+    # If a candidate points us at .../python/zmqRemoteApi, go one level up
+    if os.path.basename(internal) == "zmqRemoteApi":
+        return os.path.dirname(internal)
+    return internal
+
+
+# Normalized + de-duplicated once, so the search loop only does string joins and stat() calls.
+_INTERNAL_PY_DIRS = list(dict.fromkeys(_normalize_internal(p) for p in COPPELIA_INTERNAL_PY_CANDIDATES))
+
+
+def _load_cached_py_path():
+    """Return the cached COPPELIA_PY_PATH if it is still valid, else None."""
+    try:
+        cached = json.loads(COPPELIA_PY_PATH_CACHE.read_text())
+        py_path = cached["py_path"]
+        if os.stat(py_path).st_mtime_ns != cached["app_mtime"]:
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not is_valid_zmq_client(py_path):
+        return None
+    return py_path
+
+
+def _save_cached_py_path(py_path: str) -> None:
+    """Persist a discovered COPPELIA_PY_PATH. Failures are ignored (cache is optional)."""
+    try:
+        COPPELIA_PY_PATH_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        COPPELIA_PY_PATH_CACHE.write_text(json.dumps({
+            "app_mtime": os.stat(py_path).st_mtime_ns,
+            "py_path": py_path,
+        }))
+    except OSError:
+        pass
+
+
+def _unique_app_candidates():
+    """Yield the COPPELIA_APP_CANDIDATES that exist, once per underlying app bundle."""
+    # On case-insensitive volumes (the macOS default) coppeliaSim.app and CoppeliaSim.app
+    # are the same folder, so dedupe on (st_dev, st_ino). The one stat() per app also
+    # rules out missing apps before probing any of their internal folders.
+    seen = set()
+    for app_path in COPPELIA_APP_CANDIDATES:
+        try:
+            st = os.stat(app_path)
+        except OSError:
+            continue
+        key = (st.st_dev, st.st_ino)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield app_path
+
+
+def find_coppelia_python_folder() -> str:
+    """Return an app-bundled folder we can add to sys.path so `import zmqRemoteApi` works."""
+    cached = _load_cached_py_path()
+    if cached is not None:
+        return cached
+
+    py_path = _search_coppelia_python_folder()
+    _save_cached_py_path(py_path)
+    return py_path
+
+
+def _probe_app(app_path: str):
+    """Return the ZMQ client folder inside app_path, or None. Works on plain strings."""
+    for internal in _INTERNAL_PY_DIRS:
+        py_path = os.path.join(app_path, internal)
+        if is_valid_zmq_client(py_path):
+            return py_path
+    return None
+
+
+def _search_coppelia_python_folder() -> str:
+    """Walk the known install locations looking for the ZMQ Remote API python client."""
+    # 1) Try the explicit app candidates first
+    for app_path in _unique_app_candidates():
+        py_path = _probe_app(app_path)
+        if py_path is not None:
+            return py_path
+
+    # 2) Fallback: try to find any likely CoppeliaSim*.app in /Applications or Downloads
+    for base in ["/Applications", os.path.join(os.path.expanduser("~"), "Downloads")]:
+        try:
+            entries = os.scandir(base)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                # Filter on the name first; DirEntry.is_dir() reuses d_type from
+                # the directory listing, so only symlinked bundles cost a stat().
+                name = entry.name.lower()
+                if not name.endswith(".app") or "coppelia" not in name:
+                    continue
+                if not entry.is_dir():
+                    continue
+                py_path = _probe_app(entry.path)
+                if py_path is not None:
+                    return py_path
+
+    raise FileNotFoundError(
+        "Could not find CoppeliaSim's ZMQ Remote API python client inside the .app.\n"
+        "Fix: confirm your CoppeliaSim app is in /Applications, then locate this folder:\n"
+        "  <CoppeliaSim.app>/Contents/Resources/programming/zmqRemoteApi/clients/python\n"
+        "That folder should contain a 'zmqRemoteApi' directory and a 'src' directory (or src nested under zmqRemoteApi).\n"
+        "If your app name/path differs, update COPPELIA_APP_CANDIDATES."
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_py_path() -> str:
+    """Return COPPELIA_PY_PATH, running discovery at most once per process."""
+    return find_coppelia_python_folder()
+
+
+# Set once ensure_on_sys_path() has completed; later calls return immediately.
+_BOOTSTRAPPED = False
+
+
+def _move_to_index(entry: str, index: int) -> None:
+    """Place entry at sys.path[index], skipping the list surgery if it is already there."""
+    if sys.path[index:index + 1] == [entry]:
+        return
+    try:
+        sys.path.remove(entry)
+    except ValueError:
+        pass
+    sys.path.insert(index, entry)
+
+
+def ensure_on_sys_path() -> None:
+    """Make sure we import the *bundled* zmqRemoteApi, not a local folder."""
+    global _BOOTSTRAPPED
+    if _BOOTSTRAPPED:
+        # Path setup and sanity checks already done in this process
+        return
+    script_dir = Path(__file__).resolve().parent
+
+    # COPPELIA_PY_PATH is auto-detected on first use (not at import time),
+    # so importing a phase script never touches the filesystem.
+    coppelia_py_path = get_py_path()
+    coppelia_path = Path(coppelia_py_path)
+    if not coppelia_path.exists():
+        raise FileNotFoundError(
+            f"CoppeliaSim python folder not found at: {coppelia_py_path}\n"
+            "Fix: move the .app into /Applications, or update COPPELIA_APP_CANDIDATES."
+        )
+
+    # Quick sanity: show what Python will see
+    # (helps if you're accidentally running a different file)
+    if VERBOSE:
+        print("[INFO] Running:", Path(sys.argv[0]).resolve())
+        print("[INFO] Using COPPELIA_PY_PATH:", coppelia_py_path)
+
+    # If you copied a `zmqRemoteApi/` folder into this project, it can shadow the real one.
+    # This is exactly what causes: ModuleNotFoundError: No module named 'src'
+    local_pkg = script_dir / "zmqRemoteApi"
+    if _is_dir(local_pkg):
+        print("[WARN] Found local folder:", local_pkg)
+        print("[WARN] This can shadow CoppeliaSim's bundled zmqRemoteApi and break imports.")
+        print("[WARN] Recommended fix: rename/delete that local folder (e.g., zmqRemoteApi_old).")
+
+    if not _is_dir(coppelia_path / "src") and not _is_dir(coppelia_path / "zmqRemoteApi" / "src"):
+        print("[WARN] Could not find a 'src' package next to zmqRemoteApi.")
+        print("[WARN] Expected either:")
+        print("       - COPPELIA_PY_PATH/src")
+        print("       - COPPELIA_PY_PATH/zmqRemoteApi/src")
+        print("[WARN] Open Finder at COPPELIA_PY_PATH and confirm the folder contents.")
+
+    # Put Coppelia's python folder FIRST so it wins the import resolution.
+    _move_to_index(coppelia_py_path, 0)
+    
+    # Also add src folder for new module name (coppeliasim_zmqremoteapi_client)
+    src_path_str = str(coppelia_path / "src")
+    if src_path_str not in sys.path and _is_dir(src_path_str):
+        sys.path.insert(0, src_path_str)
+
+    # Also, if script_dir is first (it usually is), and contains a shadowing folder,
+    # temporarily move script_dir behind COPPELIA_PY_PATH.
+    if str(script_dir) in sys.path:
+        _move_to_index(str(script_dir), 1)
+
+    _BOOTSTRAPPED = True
+
+
+# RemoteAPIClient class, resolved on first use and reused for the rest of the process.
+_REMOTE_API_CLIENT = None
+
+
+def import_remote_api_client():
+    """Return the RemoteAPIClient class, importing it (after path setup) only once."""
+    global _REMOTE_API_CLIENT
+    if _REMOTE_API_CLIENT is not None:
+        return _REMOTE_API_CLIENT
+
+    if not _BOOTSTRAPPED:
+        ensure_on_sys_path()
+
+    # Import AFTER path setup
+    # Try new module name first (no warning), fallback to deprecated zmqRemoteApi
+    try:
+        from coppeliasim_zmqremoteapi_client import RemoteAPIClient
+    except ImportError:
+        try:
+            # Fallback to deprecated but still working import
+            from zmqRemoteApi import RemoteAPIClient
+        except Exception:
+            print("[ERROR] Failed to import coppeliasim_zmqremoteapi_client or zmqRemoteApi.")
+            print("[ERROR] This usually means either:")
+            print("  1) COPPELIA_PY_PATH is wrong, OR")
+            print("  2) a local folder named 'zmqRemoteApi' is shadowing the real one, OR")
+            print("  3) COPPELIA_PY_PATH is missing the 'src' folder.")
+            raise
+
+    _REMOTE_API_CLIENT = RemoteAPIClient
+    return RemoteAPIClient
@@ -1,217 +1,181 @@
 #!/usr/bin/env python3
 """
 Phase 4: Kinematic Jacobian controller for Franka Panda end-effector control.
-Uses numerical Jacobian computation and damped least squares to move the end-effector
+Uses a geometric (or numerical) Jacobian and damped least squares to move the end-effector
 in a circular pattern in the x-y plane.
 """
 
+import os
 import sys
 import time
 import math
-from pathlib import Path
-
-# --- CoppeliaSim ZMQ Remote API (macOS) ------------------------------------
-# The ZMQ python client lives inside the CoppeliaSim app bundle.
-# I add that folder to PYTHONPATH so `import coppeliasim_zmqremoteapi_client` works.
-# (Note: `import zmqRemoteApi` is deprecated but still works)
-# NOTE (CoppeliaSim 4.1+ layout):
-# The ZMQ Remote API Python client is typically located at:
-#   <CoppeliaSim.app>/Contents/Resources/programming/zmqRemoteApi/clients/python
-# That folder should contain:
-#   - zmqRemoteApi/   (package)
-#   - src/            (package)
-# Some builds also ship a minimal `Contents/Resources/python` folder WITHOUT zmqRemoteApi.
-# so i search multiple candidate folders inside the .app.
-COPPELIA_APP_CANDIDATES = [
-    # Common macOS install locations / app names:
-    "/Applications/coppeliaSim.app",
-    "/Applications/CoppeliaSimEdu.app",
-    "/Applications/CoppeliaSim.app",
-    "/Applications/CoppeliaSimEdu_V4_10_0_rev0.app",
-
-    # If you run the app directly from Downloads:
-    str(Path.home() / "Downloads" / "coppeliaSim.app"),
-    str(Path.home() / "Downloads" / "CoppeliaSimEdu.app"),
-    str(Path.home() / "Downloads" / "CoppeliaSim.app"),
-    str(Path.home() / "Downloads" / "CoppeliaSimEdu_V4_10_0_rev0.app"),
-]
-
-# Candidate internal folders within the .app that may contain the ZMQ Remote API python client
-COPPELIA_INTERNAL_PY_CANDIDATES = [
-    "Contents/Resources/programming/zmqRemoteApi/clients/python",  # common
-    "Contents/Resources/programming/zmqRemoteApi/clients/python/zmqRemoteApi",  # fallback (some zips)
-    "Contents/Resources/python",  # older/alternate
-]
-
-
-def find_coppelia_python_folder() -> str:
-    """Return an app-bundled folder I can add to sys.path so `import zmqRemoteApi` works."""
-
-    def is_valid_zmq_client(py_path: Path) -> bool:
-        # Accept either
-        #   py_path/zmqRemoteApi + py_path/src
-        # or
-        #   py_path/zmqRemoteApi/src  (src nested)
-        if (py_path / "zmqRemoteApi").is_dir():
-            if (py_path / "src").is_dir():
-                return True
-            if (py_path / "zmqRemoteApi" / "src").is_dir():
-                return True
-        return False
-
-    def normalize(py_path: Path) -> Path:
-        # If the user points me at .../python/zmqRemoteApi, go one level up
-        if py_path.name == "zmqRemoteApi":
-            return py_path.parent
-        return py_path
-
-    # 1) Try the explicit app candidates first
-    for app_path in COPPELIA_APP_CANDIDATES:
-        app = Path(app_path)
-        for internal in COPPELIA_INTERNAL_PY_CANDIDATES:
-            py_path = normalize(app / internal)
-            if py_path.exists() and is_valid_zmq_client(py_path):
-                return str(py_path)
-
-    # 2) Fallback: try to find any likely CoppeliaSim*.app in /Applications or Downloads
-    for base in [Path("/Applications"), Path.home() / "Downloads"]:
-        if not base.exists():
-            continue
-        for app in base.glob("*.app"):
-            name = app.name.lower()
-            if "coppelia" in name or "coppeliasim" in name:
-                for internal in COPPELIA_INTERNAL_PY_CANDIDATES:
-                    py_path = normalize(app / internal)
-                    if py_path.exists() and is_valid_zmq_client(py_path):
-                        return str(py_path)
-
-    raise FileNotFoundError(
-        "Could not find CoppeliaSim's ZMQ Remote API python client inside the .app.\n"
-        "Fix: confirm your CoppeliaSim app is in /Applications, then locate this folder:\n"
-        "  <CoppeliaSim.app>/Contents/Resources/programming/zmqRemoteApi/clients/python\n"
-        "That folder should contain a 'zmqRemoteApi' directory and a 'src' directory (or src nested under zmqRemoteApi).\n"
-        "If your app name/path differs, update COPPELIA_APP_CANDIDATES."
-    )
-
-
-COPPELIA_PY_PATH = find_coppelia_python_folder()
-
-
-def mat_mult(A, B):
-    """Matrix multiplication: A @ B"""
-    rows_A, cols_A = len(A), len(A[0])
-    rows_B, cols_B = len(B), len(B[0])
-    if cols_A != rows_B:
-        raise ValueError("Matrix dimensions incompatible")
-    result = [[0.0] * cols_B for _ in range(rows_A)]
-    for i in range(rows_A):
-        for j in range(cols_B):
-            for k in range(cols_A):
-                result[i][j] += A[i][k] * B[k][j]
-    return result
-
-
-def mat_transpose(A):
-    """Matrix transpose: A^T"""
-    return [[A[j][i] for j in range(len(A))] for i in range(len(A[0]))]
-
-
-def mat_add(A, B):
-    """Matrix addition: A + B"""
-    return [[A[i][j] + B[i][j] for j in range(len(A[0]))] for i in range(len(A))]
-
-
-def mat_scale(A, scalar):
-    """Matrix scaling: scalar * A"""
-    return [[scalar * A[i][j] for j in range(len(A[0]))] for i in range(len(A))]
-
-
-def mat_eye(n):
-    """Identity matrix of size n x n"""
-    return [[1.0 if i == j else 0.0 for j in range(n)] for i in range(n)]
-
-
-def vec_norm(v):
-    """Vector norm: ||v||"""
-    return math.sqrt(sum(x * x for x in v))
-
-
-def solve_3x3(A, b):
-    """Solve 3x3 linear system Ax = b using Cramer's rule"""
-    det = (A[0][0] * (A[1][1] * A[2][2] - A[1][2] * A[2][1]) -
-           A[0][1] * (A[1][0] * A[2][2] - A[1][2] * A[2][0]) +
-           A[0][2] * (A[1][0] * A[2][1] - A[1][1] * A[2][0]))
-    
-    if abs(det) < 1e-10:
-        raise ValueError("Matrix is singular")
-    
-    det_x = (b[0] * (A[1][1] * A[2][2] - A[1][2] * A[2][1]) -
-             A[0][1] * (b[1] * A[2][2] - A[1][2] * b[2]) +
-             A[0][2] * (b[1] * A[2][1] - A[1][1] * b[2]))
-    
-    det_y = (A[0][0] * (b[1] * A[2][2] - A[1][2] * b[2]) -
-             b[0] * (A[1][0] * A[2][2] - A[1][2] * A[2][0]) +
-             A[0][2] * (A[1][0] * b[2] - b[1] * A[2][0]))
-    
-    det_z = (A[0][0] * (A[1][1] * b[2] - b[1] * A[2][1]) -
-             A[0][1] * (A[1][0] * b[2] - b[1] * A[2][0]) +
-             b[0] * (A[1][0] * A[2][1] - A[1][1] * A[2][0]))
-    
-    return [det_x / det, det_y / det, det_z / det]
-
-
-def ensure_coppelia_python_path() -> None:
-    """Make sure I import the *bundled* zmqRemoteApi, not a local folder."""
-    script_dir = Path(__file__).resolve().parent
-
-    # COPPELIA_PY_PATH is auto-detected at import time
-    coppelia_path = Path(COPPELIA_PY_PATH)
-    if not coppelia_path.exists():
-        raise FileNotFoundError(
-            f"CoppeliaSim python folder not found at: {COPPELIA_PY_PATH}\n"
-            "Fix: move the .app into /Applications, or update COPPELIA_APP_CANDIDATES."
-        )
-
-    # Quick sanity: show what Python will see
-    # (helps if you're accidentally running a different file)
-    print("[INFO] Running:", Path(__file__).resolve())
-    print("[INFO] Using COPPELIA_PY_PATH:", COPPELIA_PY_PATH)
-
-    # If you copied a `zmqRemoteApi/` folder into this project, it can shadow the real one.
-    # This is exactly what causes: ModuleNotFoundError: No module named 'src'
-    local_pkg = script_dir / "zmqRemoteApi"
-    if local_pkg.exists() and local_pkg.is_dir():
-        print("[WARN] Found local folder:", local_pkg)
-        print("[WARN] This can shadow CoppeliaSim's bundled zmqRemoteApi and break imports.")
-        print("[WARN] Recommended fix: rename/delete that local folder (e.g., zmqRemoteApi_old).")
-
-    if not (coppelia_path / "src").exists() and not (coppelia_path / "zmqRemoteApi" / "src").exists():
-        print("[WARN] Could not find a 'src' package next to zmqRemoteApi.")
-        print("[WARN] Expected either:")
-        print("       - COPPELIA_PY_PATH/src")
-        print("       - COPPELIA_PY_PATH/zmqRemoteApi/src")
-        print("[WARN] Open Finder at COPPELIA_PY_PATH and confirm the folder contents.")
-
-    # Put Coppelia's python folder FIRST so it wins the import resolution.
-    if COPPELIA_PY_PATH in sys.path:
-        sys.path.remove(COPPELIA_PY_PATH)
-    sys.path.insert(0, COPPELIA_PY_PATH)
-    
-    # Also add src folder for new module name (coppeliasim_zmqremoteapi_client)
-    src_path = Path(COPPELIA_PY_PATH) / "src"
-    if src_path.exists():
-        src_path_str = str(src_path)
-        if src_path_str not in sys.path:
-            sys.path.insert(0, src_path_str)
-
-    # Also, if script_dir is first (it usually is), and contains a shadowing folder,
-    # temporarily move script_dir behind COPPELIA_PY_PATH.
+import queue
+import threading
+
+import numpy as np
+
+from coppelia_batch import (
+    get_joint_positions_and_tip,
+    get_object_matrices,
+    get_object_names,
+    get_perturbed_tip_positions,
+    set_joint_positions,
+)
+from coppelia_bootstrap import VERBOSE, ensure_on_sys_path, import_remote_api_client
+
+# dtype of the control arithmetic (J, dx, dq). float32 carries ~7 significant digits,
+# far more than a 2 mm/step circle needs, and with the adaptive damping the smallest
+# eigenvalue of J J^T + lambda^2 I never drops below min(SIG_THRESH, LAMBDA)^2,
+# so its condition number stays in the hundreds. Joint and tip positions stay float64:
+# q accumulates dq every step, and the finite differences are taken before the cast.
+CONTROL_DTYPE = np.float32
+
+
+def geometric_jacobian(sim, joint_handles, p):
+    """Position Jacobian (3 x n) from the joints' world frames: J[:, i] = z_i x (p - o_i)"""
+    # Every Panda joint is revolute, and CoppeliaSim rotates a revolute joint about its
+    # own z-axis. So column i only needs joint i's axis z_i and origin o_i in the world
+    # frame, which I read straight from its object matrix (no perturbation, no stepping;
+    # all joints in one round-trip, see coppelia_batch).
+    # sim.getObjectMatrix returns the 3x4 row-major [R | o]: column 2 is z, column 3 is o.
+    M = np.asarray(get_object_matrices(sim, joint_handles)).reshape(-1, 3, 4)
+    z = M[:, :, 2]
+    o = M[:, :, 3]
+    return np.ascontiguousarray(np.cross(z, p - o).T, dtype=CONTROL_DTYPE)
+
+
+def numerical_jacobian(sim, joint_handles, tip_handle, q, p, eps):
+    """Position Jacobian (3 x n) by finite differences: J[:, i] = (p(q + eps*e_i) - p) / eps"""
+    # Perturb one joint at a time (the others stay at q) and read the tip back;
+    # setJointPosition updates the kinematic chain immediately, so no stepping is needed.
+    # The perturbations share one scene, so they cannot overlap (e.g. from several
+    # clients in threads) without corrupting each other's columns. Instead the whole
+    # sweep runs inside CoppeliaSim in one round-trip (see coppelia_batch).
+    p_pert = np.asarray(get_perturbed_tip_positions(sim, joint_handles, tip_handle, q, eps))
+    return np.ascontiguousarray((p_pert - p).T / eps, dtype=CONTROL_DTYPE)
+
+
+def dls_step_numpy(J, dx, lam, sig_thresh, max_dq, dq, S_damped, Utdx):
+    """Damped least-squares step into dq (clipped per joint and in norm); returns |dq|
+
+    S_damped and Utdx are preallocated 3-element scratch buffers, filled in place.
+    """
+    # Standard least squares: dq = J^T @ (J @ J^T)^(-1) @ dx
+    # Damped least squares adds regularization: dq = J^T @ (J @ J^T + lambda^2*I)^(-1) @ dx
+    # The damping parameter lambda prevents singularities when J is near-singular
+    # (e.g., when the robot is in a singular configuration).
+    # Written with the SVD J = U S V^T this is dq = V diag(s / (s^2 + lambda^2)) U^T dx,
+    # which lets me damp adaptively: lambda^2 ramps up from 0 only once the smallest
+    # singular value drops below sig_thresh, so tracking is undamped (faster) away
+    # from singularities and keeps the same stability margin near them.
+    U, S, Vt = np.linalg.svd(J, full_matrices=False)
+    lam2 = lam**2 * max(0.0, 1.0 - (S[-1] / sig_thresh) ** 2)
+    np.multiply(S, S, out=S_damped)
+    S_damped += lam2
+    np.divide(S, S_damped, out=S_damped)
+    np.matmul(dx, U, out=Utdx)  # U^T dx
+    Utdx *= S_damped
+    np.matmul(Utdx, Vt, out=dq)  # V (S_damped * U^T dx)
+
+    # Clip joint velocities to prevent instability (per-joint)
+    np.clip(dq, -max_dq, max_dq, out=dq)
+
+    # Additional global norm clamp to prevent large |dq| spikes
+    # (after scaling the norm is exactly min(n, max_dq), no need to recompute it)
+    n = np.linalg.norm(dq)
+    dq *= min(1.0, max_dq / max(n, 1e-12))
+    return min(n, max_dq)
+
+
+def _dls_step_loops(J, dx, lam, sig_thresh, max_dq, dq):
+    """Same step as dls_step_numpy() in scalar loops, for Numba to compile"""
+    # Instead of the SVD I form A = J J^T (3x3, symmetric) directly. Its smallest
+    # eigenvalue is sigma_min^2, which drives the adaptive damping, and
+    # dq = J^T (A + lambda^2 I)^(-1) dx is solved with a 3x3 Cholesky factorization.
+    n_joints = J.shape[1]
+    a00 = a01 = a02 = a11 = a12 = a22 = 0.0
+    for j in range(n_joints):
+        x, y, z = J[0, j], J[1, j], J[2, j]
+        a00 += x * x
+        a01 += x * y
+        a02 += x * z
+        a11 += y * y
+        a12 += y * z
+        a22 += z * z
+
+    # Smallest eigenvalue of A, closed form for a symmetric 3x3 matrix
+    m = (a00 + a11 + a22) / 3.0
+    b00, b11, b22 = a00 - m, a11 - m, a22 - m
+    p2 = (b00 * b00 + b11 * b11 + b22 * b22 + 2.0 * (a01 * a01 + a02 * a02 + a12 * a12)) / 6.0
+    if p2 <= 1e-30:
+        ev_min = m  # A is (a multiple of) the identity
+    else:
+        p = math.sqrt(p2)
+        det_b = b00 * (b11 * b22 - a12 * a12) - a01 * (a01 * b22 - a12 * a02) + a02 * (a01 * a12 - b11 * a02)
+        r = min(1.0, max(-1.0, det_b / (2.0 * p2 * p)))
+        ev_min = m + 2.0 * p * math.cos(math.acos(r) / 3.0 + 2.0 * math.pi / 3.0)
+    lam2 = lam * lam * max(0.0, 1.0 - max(ev_min, 0.0) / (sig_thresh * sig_thresh))
+
+    # Cholesky A + lambda^2 I = L L^T, then solve L L^T w = dx
+    l00 = math.sqrt(a00 + lam2)
+    l10 = a01 / l00
+    l20 = a02 / l00
+    l11 = math.sqrt(a11 + lam2 - l10 * l10)
+    l21 = (a12 - l20 * l10) / l11
+    l22 = math.sqrt(a22 + lam2 - l20 * l20 - l21 * l21)
+    y0 = dx[0] / l00
+    y1 = (dx[1] - l10 * y0) / l11
+    y2 = (dx[2] - l20 * y0 - l21 * y1) / l22
+    w2 = y2 / l22
+    w1 = (y1 - l21 * w2) / l11
+    w0 = (y0 - l10 * w1 - l20 * w2) / l00
+
+    # dq = J^T w, clipped per joint, then clamped in norm
+    sq = 0.0
+    for j in range(n_joints):
+        v = J[0, j] * w0 + J[1, j] * w1 + J[2, j] * w2
+        v = min(max_dq, max(-max_dq, v))
+        dq[j] = v
+        sq += v * v
+    n = math.sqrt(sq)
+    scale = min(1.0, max_dq / max(n, 1e-12))
+    for j in range(n_joints):
+        dq[j] *= scale
+    return min(n, max_dq)
+
+
+def _numba_dls_step():
+    """dls_step_numpy() counterpart backed by the Numba-compiled _dls_step_loops(), or None."""
     try:
-        if str(script_dir) in sys.path:
-            sys.path.remove(str(script_dir))
-            sys.path.insert(1, str(script_dir))
-    except Exception:
-        pass
+        from numba import njit
+    except ImportError:
+        print("[WARN] COPPELIA_NUMBA is set but Numba is not installed; using the NumPy DLS step.")
+        return None
+    kernel = njit(cache=True, fastmath=True)(_dls_step_loops)
+
+    def dls_step_numba(J, dx, lam, sig_thresh, max_dq, dq, S_damped, Utdx):
+        # Same call as dls_step_numpy(); the scalar kernel needs no scratch buffers
+        return kernel(J, dx, lam, sig_thresh, max_dq, dq)
+
+    return dls_step_numba
+
+
+# Numba is opt-in (COPPELIA_NUMBA=1): importing it and compiling (or loading) the kernel
+# costs a fraction of a second at startup, more than it saves over a run whose loop time
+# is dominated by RPC latency. By default the loop uses the NumPy/LAPACK version.
+dls_step = dls_step_numpy
+if os.environ.get("COPPELIA_NUMBA"):
+    dls_step = _numba_dls_step() or dls_step_numpy
+
+
+def _print_check_lines(log_queue) -> None:
+    """Log thread: print the [CHECK] records put on log_queue until it receives None."""
+    while True:
+        record = log_queue.get()
+        if record is None:
+            return
+        t, dx_norm, p, dq_norm = record
+        print(f"[CHECK] t={t:.3f}, |dx|={dx_norm:.6f}, p=[{p[0]:.4f},{p[1]:.4f},{p[2]:.4f}], |dq|={dq_norm:.6f}")
 
 
 def main() -> None:
@@ -236,38 +200,31 @@ def main() -> None:
         "/Franka/Franka_link8_resp",
         "/Franka/Franka_link7_resp",
     ]
-    USE_STEPPING = True
+    USE_STEPPING = True  # False: CoppeliaSim runs freely and I pace the loop to DT in wall-clock time
     DT = 0.05
     DURATION = 8.0
+    JACOBIAN_MODE = "geometric"  # "geometric" (joint axes) or "numerical" (finite differences)
     EPS = 1e-4  # Finite difference perturbation for numerical Jacobian
-    LAMBDA = 0.1  # Damping parameter for damped least squares
+    LAMBDA = 0.1  # Damping parameter for damped least squares (maximum, see SIG_THRESH)
+    SIG_THRESH = 0.05  # damping only kicks in when the smallest singular value of J drops below this
     MAX_DQ = 0.05  # Maximum joint velocity per step (rad)
     STEP_SIZE = 0.002  # Desired end-effector motion per step (meters)
-    JACOBIAN_UPDATE_PERIOD = 5  # recompute Jacobian every N control steps
+    CIRCLE_FREQ = 0.1  # Hz, angular speed of the circle reference
+    JACOBIAN_Q_THRESH = 0.02  # recompute J once the joints moved this far (rad) since the last update...
+    JACOBIAN_ERR_THRESH = 5e-3  # ...or once the tip missed its commanded position by this much (m)
+    TIME_RESYNC_PERIOD = 50  # when stepping, re-read the simulation time every N steps
 
     # IMPORTANT:
     # - In CoppeliaSim: Modules to Connectivity to ZMQ remote API server (running)
     # - Default port is usually 23000
-    ensure_coppelia_python_path()
+    ensure_on_sys_path()
 
     # Show the first few search paths so I can debug import resolution
-    print("[INFO] sys.path[0:5]=", sys.path[0:5])
+    if VERBOSE:
+        print("[INFO] sys.path[0:5]=", sys.path[0:5])
 
-    # Import AFTER path setup
-    # Try new module name first (no warning), fallback to deprecated zmqRemoteApi
-    try:
-        from coppeliasim_zmqremoteapi_client import RemoteAPIClient
-    except ImportError:
-        try:
-            # Fallback to deprecated but still working import
-            from zmqRemoteApi import RemoteAPIClient
-        except Exception as e:
-            print("[ERROR] Failed to import coppeliasim_zmqremoteapi_client or zmqRemoteApi.")
-            print("[ERROR] This usually means either:")
-            print("  1) COPPELIA_PY_PATH is wrong, OR")
-            print("  2) a local folder named 'zmqRemoteApi' is shadowing the real one, OR")
-            print("  3) COPPELIA_PY_PATH is missing the 'src' folder.")
-            raise
+    # Import AFTER path setup (cached by coppelia_bootstrap after the first call)
+    RemoteAPIClient = import_remote_api_client()
 
     # Connect to CoppeliaSim
     print("\n[STEP 1] Connecting to CoppeliaSim...")
@@ -315,17 +272,17 @@ def main() -> None:
         print("[WARN] Could not find tip handle via paths. Searching scene...")
         try:
             # Search for objects containing "tip", "hand", "link7", or "link8" in name
+            # One call for the handles and one batched call for all their names,
+            # then filter locally (instead of one getObjectName round-trip per object)
             all_objects = sim.getObjectsInTree(sim.handle_scene, sim.handle_all, 0)
             candidates = []
-            for obj in all_objects:
-                try:
-                    name = sim.getObjectName(obj)
-                    name_lower = name.lower()
-                    if any(keyword in name_lower for keyword in ["tip", "hand", "link7", "link8"]):
-                        candidates.append((name, obj))
-                except Exception:
-                    pass
-            
+            for obj, name in zip(all_objects, get_object_names(sim, all_objects)):
+                if name is None:
+                    continue  # name could not be read: skip this object, keep searching
+                name_lower = name.lower()
+                if any(keyword in name_lower for keyword in ["tip", "hand", "link7", "link8"]):
+                    candidates.append((name, obj))
+
             if candidates:
                 print("Found candidate objects:")
                 for name, handle in candidates:
@@ -385,111 +342,135 @@ def main() -> None:
     loop_start_time = sim.getSimulationTime()
     dq_norms = []
     J = None  # Cache Jacobian
+    jacobian_updates = 0
+    warned_degenerate_J = False
     step_counter = 0
     actual_duration = 0.0  # Initialize in case of early exit
 
+    # Circle reference: instead of calling cos/sin on t every tick, I rotate
+    # (cos(wt), sin(wt)) by w times the simulation time that passed, and write it into a
+    # preallocated dx buffer. When stepping, every step is exactly the scene's time step,
+    # so the rotation is fixed and precomputed here; free-running, the simulation advances
+    # by a varying amount per tick, so the angle comes from the simulation clock (see below).
+    omega = 2 * math.pi * CIRCLE_FREQ
+    if USE_STEPPING:
+        dt_step = sim.getSimulationTimeStep()
+        cos_dw = math.cos(omega * dt_step)
+        sin_dw = math.sin(omega * dt_step)
+    cos_t, sin_t = 1.0, 0.0
+    dx = np.zeros(3, dtype=CONTROL_DTYPE)
+
+    # Work buffers for the DLS step, allocated once and filled in place every tick
+    # (on arrays this small the allocations cost more than the arithmetic).
+    n_joints = len(joint_handles)
+    q = np.empty(n_joints)
+    p = np.empty(3)
+    q_jac = np.empty(n_joints)  # q at the last Jacobian update
+    p_expected = np.empty(3)  # p + dx from the previous step, to measure the tracking error
+    q_new = np.empty(n_joints)
+    dq = np.empty(n_joints, dtype=CONTROL_DTYPE)
+    S_damped = np.empty(3, dtype=CONTROL_DTYPE)
+    Utdx = np.empty(3, dtype=CONTROL_DTYPE)
+
+    # With COPPELIA_NUMBA, compile (or load) the DLS kernel now rather than on the first control step
+    dls_step(np.eye(3, n_joints, dtype=CONTROL_DTYPE), dx, LAMBDA, SIG_THRESH, MAX_DQ, dq, S_damped, Utdx)
+
+    # Printing happens on a background thread so stdout never stalls the control loop.
+    # The queue is bounded; if the printer falls behind, log lines are dropped, not waited on.
+    log_queue = queue.Queue(maxsize=64)
+    log_thread = threading.Thread(target=_print_check_lines, args=(log_queue,), daemon=True)
+    log_thread.start()
+
+    # Without stepping, sleep until fixed deadlines (next_tick += DT) rather than a flat
+    # DT after the work, so the loop period does not drift by the time spent computing.
+    next_tick = time.monotonic()
+
     try:
-        while (sim.getSimulationTime() - loop_start_time) < DURATION:
-            t_sim = sim.getSimulationTime()
-            t = t_sim - loop_start_time
+        # Time since loop start. When stepping, every client.step() advances the simulation
+        # by exactly dt_step, so I count it locally and only re-read the real simulation
+        # time every TIME_RESYNC_PERIOD steps; free-running, I read it once per tick.
+        t = 0.0
+        while t < DURATION:
             step_counter += 1
 
-            # Read current joint positions
-            q = [sim.getJointPosition(h) for h in joint_handles]
-
-            # Read current tip position (in world frame, -1 means absolute position)
-            p = list(sim.getObjectPosition(tip_handle, -1))
+            # Read current joint positions and tip position (world frame), in one RPC
+            q[:], p[:] = get_joint_positions_and_tip(sim, joint_handles, tip_handle)
 
             # Define desired motion: circle in x-y plane
             # The Jacobian relates joint velocities to end-effector velocity:
             #   dp/dt = J @ dq/dt
             # i want to move the end-effector in a circle, so i compute a desired
             # velocity dx per step, then solve for the corresponding joint velocities dq.
-            dx = [
-                STEP_SIZE * math.cos(2 * math.pi * 0.1 * t),
-                STEP_SIZE * math.sin(2 * math.pi * 0.1 * t),
-                0.0
-            ]
+            dx[0] = STEP_SIZE * cos_t
+            dx[1] = STEP_SIZE * sin_t
 
-            # Compute numerical Jacobian J (3x7) - only when needed
+            # Compute Jacobian J (3x7) - only when needed
             # The Jacobian J[i,j] = dp[i]/dq[j] tells me how the i-th Cartesian coordinate
-            # changes when I move the j-th joint. I compute it numerically by perturbing
-            # each joint and measuring the resulting change in end-effector position.
-            if J is None or step_counter % JACOBIAN_UPDATE_PERIOD == 0:
-                J = [[0.0] * 7 for _ in range(3)]
-                for i in range(7):
-                    # Perturb joint i
-                    q_pert = q[:]  # copy list
-                    q_pert[i] += EPS
-
-                    # Set all joints to perturbed configuration
-                    for j, h in enumerate(joint_handles):
-                        sim.setJointPosition(h, q_pert[j])
-                    
-                    if USE_STEPPING:
-                        client.step()
-
-                    # Read perturbed tip position
-                    p_pert = list(sim.getObjectPosition(tip_handle, -1))
-
-                    # Compute Jacobian column: J[:,i] = (p_pert - p) / EPS
-                    for k in range(3):
-                        J[k][i] = (p_pert[k] - p[k]) / EPS
-
-                    # Restore original joint configuration
-                    for j, h in enumerate(joint_handles):
-                        sim.setJointPosition(h, q[j])
-                    
-                    if USE_STEPPING:
-                        client.step()
-
-            # Solve for joint velocities using damped least squares
-            # Standard least squares: dq = J^T @ (J @ J^T)^(-1) @ dx
-            # Damped least squares adds regularization: dq = J^T @ (J @ J^T + lambda^2*I)^(-1) @ dx
-            # The damping parameter lambda prevents singularities when J is near-singular
-            # (e.g., when the robot is in a singular configuration).
-            J_T = mat_transpose(J)
-            JJT = mat_mult(J, J_T)
-            I = mat_eye(3)
-            JJT_damped = mat_add(JJT, mat_scale(I, LAMBDA**2))
-            dx_solved = solve_3x3(JJT_damped, dx)
-            dq = mat_mult(J_T, [[x] for x in dx_solved])
-            dq = [dq[i][0] for i in range(7)]  # flatten to list
-
-            # Clip joint velocities to prevent instability (per-joint)
-            dq = [max(-MAX_DQ, min(MAX_DQ, dq_i)) for dq_i in dq]
-
-            # Additional global norm clamp to prevent large |dq| spikes
-            dq_norm = vec_norm(dq)
-            if dq_norm > MAX_DQ:
-                scale = MAX_DQ / dq_norm
-                dq = [scale * x for x in dq]
-                dq_norm = vec_norm(dq)  # Update norm after scaling
+            # changes when I move the j-th joint. By default I build it analytically from
+            # the joint axes (one batched read, no perturbation); the numerical mode instead perturbs
+            # each joint and measures the resulting change in end-effector position.
+            # J only changes as the arm moves, so I keep it until the joints have drifted
+            # JACOBIAN_Q_THRESH from where it was computed, or until the last step landed
+            # more than JACOBIAN_ERR_THRESH from where J predicted it would.
+            if (
+                J is None
+                or np.linalg.norm(q - q_jac) > JACOBIAN_Q_THRESH
+                or np.linalg.norm(p - p_expected) > JACOBIAN_ERR_THRESH
+            ):
+                if JACOBIAN_MODE == "geometric":
+                    J = geometric_jacobian(sim, joint_handles, p)
+                else:
+                    J = numerical_jacobian(sim, joint_handles, tip_handle, q, p, EPS)
+                q_jac[:] = q
+                jacobian_updates += 1
+                # If J is ~0, no joint moves the tip at all (wrong tip object?) and every
+                # dq would silently be zero.
+                if not warned_degenerate_J and np.abs(J).max() < 1e-9:
+                    print("[WARN] Jacobian is numerically zero: the tip does not move with the joints. Check the tip handle.")
+                    warned_degenerate_J = True
+
+            # Solve for joint velocities using damped least squares (see dls_step_numpy)
+            dq_norm = dls_step(J, dx, LAMBDA, SIG_THRESH, MAX_DQ, dq, S_damped, Utdx)
 
             # Track dq norms for statistics
             dq_norms.append(dq_norm)
 
             # Apply joint update: q_new = q + dq
-            q_new = [q[i] + dq[i] for i in range(7)]
-            for j, h in enumerate(joint_handles):
-                sim.setJointPosition(h, q_new[j])
+            np.add(q, dq, out=q_new)
+            set_joint_positions(sim, joint_handles, q_new)
+            np.add(p, dx, out=p_expected)
 
             # Log periodically
             if last_check_time < 0 or (t - last_check_time) >= 0.5:
-                dx_norm = vec_norm(dx)
-                print(f"[CHECK] t={t:.3f}, |dx|={dx_norm:.6f}, p=[{p[0]:.4f},{p[1]:.4f},{p[2]:.4f}], |dq|={dq_norm:.6f}")
+                try:
+                    log_queue.put_nowait((t, float(np.linalg.norm(dx)), tuple(p), dq_norm))
+                except queue.Full:
+                    pass
                 last_check_time = t
 
             # Step simulation
             if USE_STEPPING:
                 client.step()
+                if step_counter % TIME_RESYNC_PERIOD == 0:
+                    t = sim.getSimulationTime() - loop_start_time
+                else:
+                    t += dt_step
+                cos_t, sin_t = cos_dw * cos_t - sin_dw * sin_t, sin_dw * cos_t + cos_dw * sin_t
             else:
-                time.sleep(DT)
+                next_tick += DT
+                time.sleep(max(0.0, next_tick - time.monotonic()))
+                t_prev, t = t, sim.getSimulationTime() - loop_start_time
+                c, s = math.cos(omega * (t - t_prev)), math.sin(omega * (t - t_prev))
+                cos_t, sin_t = c * cos_t - s * sin_t, s * cos_t + c * sin_t
 
         # Compute actual duration before stopping simulation
         actual_duration = sim.getSimulationTime() - loop_start_time
 
     finally:
+        # Let the log thread print what is still queued before anything else
+        log_queue.put(None)
+        log_thread.join()
+
         # Stop simulation safely
         print("\n[STEP 6] Stopping simulation...")
         try:
@@ -514,8 +495,8 @@ def main() -> None:
         print(f"  - Average |dq|: {avg_dq_norm:.6f} rad")
         print(f"  - Min |dq|: {min_dq_norm:.6f} rad")
         print(f"  - Max |dq|: {max_dq_norm:.6f} rad")
-    print(f"  - Jacobian update period: every {JACOBIAN_UPDATE_PERIOD} control steps")
-    print(f"  - Damping parameter (LAMBDA): {LAMBDA}")
+    print(f"  - Jacobian: {JACOBIAN_MODE}, computed {jacobian_updates} times in {step_counter} control steps")
+    print(f"  - Damping parameter (LAMBDA): {LAMBDA} (adaptive below sigma_min={SIG_THRESH})")
 
 
 if __name__ == "__main__":